@@ -12,7 +12,7 @@ from typing import Any
 __all__ = ["ModelParameterizedLayer"]
 
 
-@dataclass
+@dataclass(slots=True)
 class ModelParameterizedLayer:
     """
     A dataclass for holding a parameter and its layer
@@ -158,7 +158,7 @@ class SparsityModifierBase(Modifier):
             for name, module in get_prunable_layers(layer).items():
                 name = f"{layer_name}.{name}"
 
-                if match_targets(name, self.ignore)[0]:
+                if match_targets(name, self.ignore) >= 0:
                     continue
 
                 # HACK: previously, embeddings were not quantized because they were not
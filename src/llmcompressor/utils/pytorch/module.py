@@ -4,10 +4,14 @@ Utility / helper functions
 
 import difflib
 import re
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
 from operator import attrgetter
-from typing import Dict, List, Optional, Tuple, Union
+from types import MappingProxyType
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Tuple, Union
 
-import torch
 from compressed_tensors import InternalModule
 from compressed_tensors.quantization.utils import is_module_quantized
 from loguru import logger
@@ -21,9 +25,10 @@ try:
     quant_err = None
     from torch.nn.qat import Conv2d as QATConv2d
     from torch.nn.qat import Linear as QATLinear
-    from torch.quantization import QuantWrapper
+    from torch.quantization import FakeQuantize, QuantWrapper
 except Exception as _err:
     quant_err = _err
+    FakeQuantize = None
     QuantWrapper = None
     QATLinear = None
     QATConv2d = None
@@ -42,6 +47,22 @@ except Exception as _err:
     TransformerConv1D = None
 
 
+_PRUNABLE_TYPES = tuple(
+    layer_type
+    for layer_type in (
+        Linear,
+        _ConvNd,
+        QATLinear,
+        QATConv2d,
+        QATConv3d,
+        TransformerConv1D,
+    )
+    if layer_type is not None
+)
+_QUANTIZABLE_TYPES = (Linear, _ConvNd)
+_FAKE_QUANTIZE_TYPES = (FakeQuantize,) if FakeQuantize is not None else ()
+
+
 __all__ = [
     "match_targets",
     "get_default_params",
@@ -49,6 +70,7 @@ __all__ = [
     "get_layers",
     "get_layer",
     "set_layer",
+    "set_layers",
     "get_params",
     "get_param",
     "get_terminal_layers",
@@ -59,94 +81,205 @@ __all__ = [
     "get_matching_layer",
     "get_no_split_params",
     "get_layer_by_name",
+    "cache_module_lookups",
+    "clear_module_cache",
 ]
 
 ALL_TARGET = "__ALL__"
 ALL_PRUNABLE_TARGET = "__ALL_PRUNABLE__"
 ALL_QUANTIZABLE_TARGET = "__ALL_QUANTIZABLE__"
 
+_LAYER_INDEX_PATTERN = re.compile(r"\.(\d+)\.")
 
-def match_targets(name: str, targets: Union[str, List[str]]) -> Tuple[bool, int]:
-    if isinstance(targets, str):
-        targets = [targets]
+# {id(module) -> {(targets, params, exclude_internal_modules) -> resolved}}, only
+# populated for modules inside of a `cache_module_lookups` context, which keeps
+# them alive so that their ids cannot be reused
+_LOOKUP_CACHES: Dict[int, Dict[Tuple, Mapping]] = {}
+
+
+@dataclass(frozen=True)
+class _CompiledTarget:
+    """
+    A target preprocessed for matching against module names
+
+    :param kind: either "regex" for "re:" prefixed targets or "literal"
+    :param literal_or_pattern: the bound `match` method of the compiled pattern
+        for regex targets, otherwise the literal target string
+    """
 
-    for index, target in enumerate(targets):
+    kind: str
+    literal_or_pattern: Union[str, Callable[[str], Optional[re.Match]]]
+
+
+@lru_cache(maxsize=128)
+def _compile_targets(targets: Tuple[str, ...]) -> Tuple[_CompiledTarget, ...]:
+    compiled = []
+    for target in targets:
         if target[:3] == "re:":
-            pattern = target[3:]
-            if re.match(pattern, name):
-                return True, index
-        elif name == target:
-            return True, index
+            compiled.append(_CompiledTarget("regex", re.compile(target[3:]).match))
+        else:
+            compiled.append(_CompiledTarget("literal", target))
+
+    return tuple(compiled)
+
+
+def match_targets(name: str, targets: Union[str, List[str]]) -> int:
+    """
+    :param name: name of the layer or parameter to match
+    :param targets: names or "re:" prefixed regexes to match name against
+    :return: index of the first target matching name, or -1 if none match
+    """
+    if isinstance(targets, str):
+        targets = (targets,)
+    elif not isinstance(targets, tuple):
+        targets = tuple(targets)
 
-    return False, -1
+    for index, target in enumerate(_compile_targets(targets)):
+        if target.kind == "regex":
+            if target.literal_or_pattern(name) is not None:
+                return index
+        elif name == target.literal_or_pattern:
+            return index
 
+    return -1
 
-def match_class(layer: Module, targets: Union[str, List[str]]) -> Tuple[bool, int]:
+
+def match_class(layer: Module, targets: Union[str, List[str]]) -> int:
+    """
+    :param layer: layer whose class name should be matched
+    :param targets: class names to match against
+    :return: index of the first target naming the class of layer, or -1 if none do
+    """
     if isinstance(targets, str):
-        targets = [targets]
+        targets = (targets,)
+    elif not isinstance(targets, tuple):
+        targets = tuple(targets)
+
+    return _class_target_index(targets).get(layer.__class__.__name__, -1)
 
-    for index, target in enumerate(targets):
-        if layer.__class__.__name__ == target:
-            return True, index
 
-    return False, -1
+@lru_cache(maxsize=128)
+def _class_target_index(targets: Tuple[str, ...]) -> Mapping[str, int]:
+    """
+    :return: read-only dict of {class name -> index of the first target naming it},
+        for all targets which could be class names, i.e. literals without dots
+    """
+    class_index = {}
+    for index, target in enumerate(_compile_targets(targets)):
+        if target.kind == "literal" and "." not in target.literal_or_pattern:
+            class_index.setdefault(target.literal_or_pattern, index)
+
+    return MappingProxyType(class_index)
+
+
+def _match_index(
+    name: str,
+    literal_index: Dict[str, int],
+    regex_list: List[Tuple[Callable[[str], Optional[re.Match]], int]],
+) -> int:
+    """
+    :return: the lowest index of the targets matching name, or -1 if none match
+    """
+    match_index = literal_index.get(name, -1)
+    for pattern, index in regex_list:
+        if 0 <= match_index < index:
+            break
+        if pattern(name) is not None:
+            return index
+
+    return match_index
 
 
 def get_default_params(layers: Dict[str, Module]) -> Dict[str, Parameter]:
     params = {}
     for name, layer in layers.items():
-        for param_name, param in layer.named_parameters():
-            if param_name == "weight":
-                params[name] = param
-                break
+        weight = layer._parameters.get("weight")
+        if weight is not None:
+            params[name] = weight
     return params
 
 
 def match_layers_params(
-    targets: Union[str, List[str]], module: Module, params: bool = False
+    targets: Union[str, List[str]],
+    module: Module,
+    params: bool = False,
+    exclude_internal_modules: bool = False,
 ) -> Dict[str, Union[Module, Parameter]]:
-    if targets == ALL_TARGET:
-        values = get_terminal_layers(module)
-
-        return values if not params else get_default_params(values)
-
-    if targets == ALL_PRUNABLE_TARGET:
-        values = get_prunable_layers(module)
-
-        return values if not params else get_default_params(values)
+    if targets in (ALL_TARGET, ALL_PRUNABLE_TARGET, ALL_QUANTIZABLE_TARGET):
+        if targets == ALL_TARGET:
+            values = get_terminal_layers(module)
+        elif targets == ALL_PRUNABLE_TARGET:
+            values = get_prunable_layers(module)
+        else:
+            values = get_quantizable_layers(module)
 
-    if targets == ALL_QUANTIZABLE_TARGET:
-        values = get_quantizable_layers(module)
+        if exclude_internal_modules:
+            values = {
+                name: layer
+                for name, layer in values.items()
+                if not isinstance(layer, InternalModule)
+            }
 
         return values if not params else get_default_params(values)
 
     if isinstance(targets, str):
-        targets = [targets]
+        targets = (targets,)
+    else:
+        targets = tuple(targets)
+
+    resolved = _resolve_literal_targets(
+        targets, module, params, exclude_internal_modules
+    )
+    if resolved is not None:
+        return resolved
+
+    # split targets so that literal names and class names resolve with a single
+    # dict lookup and only regexes need to be scanned per name
+    literal_index: Dict[str, int] = {}
+    class_index = _class_target_index(targets)
+    regex_list: List[Tuple[Callable[[str], Optional[re.Match]], int]] = []
+    for index, target in enumerate(_compile_targets(targets)):
+        if target.kind == "regex":
+            regex_list.append((target.literal_or_pattern, index))
+        else:
+            literal_index.setdefault(target.literal_or_pattern, index)
+
+    # parameter names always contain a dot, so targets such as class names alone
+    # never need the parameter names of each layer to be built and matched
+    match_param_names = len(regex_list) > 0 or any("." in t for t in literal_index)
 
     resolved = {}
     targets_found = [False for _ in range(len(targets))]
 
     for name, layer in module.named_modules():
-        match, match_index = match_targets(name, targets)
-        if match and not params:
+        # internal modules still count towards finding targets, but are not returned
+        exclude_layer = exclude_internal_modules and isinstance(layer, InternalModule)
+
+        match_index = -1 if params else _match_index(name, literal_index, regex_list)
+        if match_index < 0:
+            match_index = class_index.get(layer.__class__.__name__, -1)
+        if match_index >= 0:
             targets_found[match_index] = True
-            resolved[name] = layer
-        else:
-            match, match_index = match_class(layer, targets)
-            if match:
-                targets_found[match_index] = True
+            if not exclude_layer:
                 resolved[name] = layer
 
-        for param_name, param in layer.named_parameters():
-            if "." in param_name:  # skip parameters of nested layers
+        if not match_param_names:
+            continue
+
+        # only direct parameters of this layer, nested layers are visited later
+        for param_name, param in layer._parameters.items():
+            if param is None:
                 continue
 
-            param_match, param_match_index = match_targets(
-                f"{name}.{param_name}", targets
+            param_match_index = _match_index(
+                f"{name}.{param_name}", literal_index, regex_list
             )
-            if param_match:
+            if param_match_index >= 0:
                 targets_found[param_match_index] = True
-                resolved[f"{name}"] = layer if not params else param
+                if params:
+                    resolved[f"{name}"] = param
+                elif not exclude_layer:
+                    resolved[f"{name}"] = layer
 
     missed = [target for found, target in zip(targets_found, targets) if not found]
     if len(missed) > 0:
@@ -155,11 +288,151 @@ def match_layers_params(
     return resolved
 
 
+def _resolve_literal_targets(
+    targets: Tuple[str, ...],
+    module: Module,
+    params: bool,
+    exclude_internal_modules: bool,
+) -> Optional[Dict[str, Union[Module, Parameter]]]:
+    """
+    Resolve targets which are all full paths of submodules or parameters by walking
+    those paths instead of every module in the tree
+
+    Unlike the scan, which follows `named_modules`, this does not deduplicate
+    submodules registered under more than one name, e.g. tied or shared layers.
+    Such a submodule resolves under every one of its names here, while the scan
+    only finds it under the first name it is visited by and reports the others
+    as missing
+
+    :return: the result of scanning the module for a tree without shared
+        submodules, or None if any target is a regex, could also be a class name,
+        or cannot be resolved by its path
+    """
+    if len(set(targets)) != len(targets):
+        return None  # duplicate targets are reported as missing by the scan
+
+    # (position in named_modules order, name, value)
+    entries = []
+    for target in targets:
+        if target[:3] == "re:" or ("." not in target and target.isidentifier()):
+            return None
+
+        *parent_parts, leaf = target.split(".")
+        layer = module
+        position = ()
+        for part in parent_parts:
+            child = layer._modules.get(part)
+            if child is None:
+                return None
+            position += (list(layer._modules).index(part),)
+            layer = child
+
+        child = layer._modules.get(leaf)
+        param = layer._parameters.get(leaf)
+        if child is not None and not params:
+            position += (list(layer._modules).index(leaf),)
+            name, value = target, child
+        elif param is not None:
+            # parameters are visited along with their layer, before its children
+            position += (-1, list(layer._parameters).index(leaf))
+            name = ".".join(parent_parts)
+            value = param if params else layer
+        else:
+            return None
+
+        # internal modules are found, but not returned
+        if not (exclude_internal_modules and isinstance(value, InternalModule)):
+            entries.append((position, name, value))
+
+    entries.sort(key=lambda entry: entry[0])
+    return {name: value for _, name, value in entries}
+
+
+def _match_layers_params_cached(
+    targets: Union[str, List[str]],
+    module: Module,
+    params: bool = False,
+    exclude_internal_modules: bool = False,
+) -> Mapping[str, Union[Module, Parameter]]:
+    module_cache = _LOOKUP_CACHES.get(id(module))
+    if module_cache is None:
+        return match_layers_params(
+            targets,
+            module,
+            params=params,
+            exclude_internal_modules=exclude_internal_modules,
+        )
+
+    key = (
+        targets if isinstance(targets, str) else tuple(targets),
+        params,
+        exclude_internal_modules,
+    )
+    if key not in module_cache:
+        module_cache[key] = MappingProxyType(
+            match_layers_params(
+                targets,
+                module,
+                params=params,
+                exclude_internal_modules=exclude_internal_modules,
+            )
+        )
+
+    return module_cache[key]
+
+
+@contextmanager
+def cache_module_lookups(module: Module) -> Iterator[None]:
+    """
+    Cache the results of `get_layers` and `get_params` for module within the
+    context, e.g. while a compression pass resolves the same targets repeatedly.
+    Cached results are read-only and are dropped when the context exits.
+
+    Only layers replaced with `set_layer` or `set_layers`, called on module or on
+    any of its submodules, are picked up automatically. Any other change made
+    within the context, such as assigning, adding or deleting submodules or
+    parameters directly, must be wrapped in `clear_module_cache`
+
+    :param module: module whose lookups should be cached
+    """
+    if id(module) in _LOOKUP_CACHES:  # already cached by an enclosing context
+        yield
+        return
+
+    _LOOKUP_CACHES[id(module)] = {}
+    try:
+        yield
+    finally:
+        del _LOOKUP_CACHES[id(module)]
+
+
+@contextmanager
+def clear_module_cache(module: Optional[Module] = None) -> Iterator[None]:
+    """
+    Drop the lookups cached by `cache_module_lookups` on entering and exiting the
+    context, so that structural changes made within it are visible to later lookups
+
+    :param module: module modified within the context. Since it may be a submodule
+        of any module whose lookups are cached, the cached lookups of all modules
+        are cleared
+    """
+    _clear_lookup_cache()
+    try:
+        yield
+    finally:
+        _clear_lookup_cache()
+
+
+def _clear_lookup_cache() -> None:
+    for module_cache in _LOOKUP_CACHES.values():
+        module_cache.clear()
+
+
 def get_layers(
     targets: Union[str, List[str]],
     module: Module,
     exclude_internal_modules: bool = False,
-) -> Dict[str, Module]:
+) -> Mapping[str, Module]:
     """
     Get layers (also known as submodules) of module based on targets
 
@@ -172,17 +445,11 @@ def get_layers(
         Defaults to False to maintain backward compatibility
 
     :return: dict of {layer name -> module} of all layers in module
-        that match targets
+        that match targets. Read-only if cached by `cache_module_lookups`
     """
-    layer_dict = match_layers_params(targets, module)
-    if exclude_internal_modules:
-        layer_dict = {
-            name: layer
-            for name, layer in layer_dict.items()
-            if not isinstance(layer, InternalModule)
-        }
-
-    return layer_dict
+    return _match_layers_params_cached(
+        targets, module, exclude_internal_modules=exclude_internal_modules
+    )
 
 
 def get_layer(target: str, module: Module) -> Tuple[str, Module]:
@@ -195,19 +462,81 @@ def get_layer(target: str, module: Module) -> Tuple[str, Module]:
 
 
 def set_layer(target: str, layer: Module, module: Module) -> Module:
-    parent_target = ".".join(target.split(".")[:-1])
-    if parent_target != "":
-        parent_layer = get_layer(parent_target, module)[1]
-    else:
-        parent_layer = module
-    old_layer = getattr(parent_layer, target.split(".")[-1])
-    setattr(parent_layer, target.split(".")[-1], layer)
+    """
+    Replace a layer of module
 
-    return old_layer
+    :param target: name of the layer to replace
+    :param layer: layer to put in its place
+    :param module: module containing the layer to replace
+    :return: the replaced layer
+    :raises ValueError: if the parent of target is not a submodule of module
+    """
+    return set_layers({target: layer}, module)[target]
 
 
-def get_params(targets: Union[str, List[str]], module: Module) -> Dict[str, Parameter]:
-    return match_layers_params(targets, module, params=True)
+def set_layers(replacements: Dict[str, Module], module: Module) -> Dict[str, Module]:
+    """
+    Replace multiple layers of module at once. All layers are resolved before any
+    of them is replaced, so module is left unchanged if any of them is missing.
+    A layer and one of its submodules cannot be replaced in the same call, use
+    separate calls instead
+
+    :param replacements: dict of {layer name -> new layer}
+    :param module: module containing the layers to replace
+    :return: dict of {layer name -> replaced layer}
+    :raises ValueError: if the parent of a layer name is not a submodule of module,
+        or if a layer name is nested within another one
+    """
+    for target in replacements:
+        parts = target.split(".")
+        for depth in range(1, len(parts)):
+            if ".".join(parts[:depth]) in replacements:
+                raise ValueError(
+                    f"Cannot replace {target} along with its parent "
+                    f"{'.'.join(parts[:depth])} in the same call"
+                )
+
+    resolved = []
+    for target in replacements:
+        parent_target, _, leaf = target.rpartition(".")
+        parent_layer = _get_submodule(parent_target, module)
+        resolved.append((target, parent_layer, leaf, getattr(parent_layer, leaf)))
+
+    old_layers = {}
+    try:
+        for target, parent_layer, leaf, old_layer in resolved:
+            setattr(parent_layer, leaf, replacements[target])
+            old_layers[target] = old_layer
+    except Exception:
+        for target, parent_layer, leaf, old_layer in resolved[: len(old_layers)]:
+            setattr(parent_layer, leaf, old_layer)
+        raise
+    finally:
+        _clear_lookup_cache()
+
+    return old_layers
+
+
+def _get_submodule(name: str, module: Module) -> Module:
+    """
+    Get a submodule by name, following registered submodules only
+
+    :raises ValueError: if name is not a submodule of module
+    """
+    layer = module
+    if name:
+        for part in name.split("."):
+            layer = layer._modules.get(part)
+            if layer is None:
+                raise ValueError(f"Could not find layer {name} in module {module}")
+
+    return layer
+
+
+def get_params(
+    targets: Union[str, List[str]], module: Module
+) -> Mapping[str, Parameter]:
+    return _match_layers_params_cached(targets, module, params=True)
 
 
 def get_param(target: str, module: Module) -> Tuple[str, Parameter]:
@@ -222,29 +551,18 @@ def get_param(target: str, module: Module) -> Tuple[str, Parameter]:
 
 
 def get_terminal_layers(module: Module) -> Dict[str, Module]:
-    terminal = {}
-
-    for name, layer in module.named_modules():
-        if len(list(layer.named_modules())) > 1:
-            continue
-
-        terminal[name] = layer
-
-    return terminal
+    return {
+        name: layer
+        for name, layer in module.named_modules()
+        if next(layer.children(), None) is None
+    }
 
 
 def get_prunable_layers(module: Module) -> Dict[str, Module]:
     prunable = {}
 
     for name, layer in module.named_modules():
-        if (
-            isinstance(layer, Linear)
-            or isinstance(layer, _ConvNd)
-            or (QATLinear and isinstance(layer, QATLinear))
-            or (QATConv2d and isinstance(layer, QATConv2d))
-            or (QATConv3d and isinstance(layer, QATConv3d))
-            or (TransformerConv1D and isinstance(layer, TransformerConv1D))
-        ):
+        if isinstance(layer, _PRUNABLE_TYPES):
             prunable[name] = layer
 
     return prunable
@@ -260,7 +578,7 @@ def get_quantizable_layers(module: Module) -> Dict[str, Module]:
     quantizable = {}
 
     for name, layer in module.named_modules():
-        if isinstance(layer, Linear) or isinstance(layer, _ConvNd):
+        if isinstance(layer, _QUANTIZABLE_TYPES):
             quantizable[name] = layer
 
     return quantizable
@@ -274,11 +592,20 @@ def qat_active(module: Module) -> bool:
     :param module: PyTorch model to check for quantization
     :return: True if quantization is active anywhere in the model, False otherwise
     """
-    for _, layer in module.named_modules():
-        if isinstance(layer, torch.quantization.FakeQuantize):
-            return True
-        if is_module_quantized(layer):
+    fake_quantize_types = _FAKE_QUANTIZE_TYPES
+    is_quantized = is_module_quantized
+
+    # like modules(), visit shared submodules once and don't follow cycles
+    seen = {id(module)}
+    stack = deque((module,))
+    while stack:
+        layer = stack.pop()
+        if isinstance(layer, fake_quantize_types) or is_quantized(layer):
             return True
+        for child in layer._modules.values():
+            if child is not None and id(child) not in seen:
+                seen.add(id(child))
+                stack.append(child)
 
     return False
 
@@ -286,13 +613,12 @@ def qat_active(module: Module) -> bool:
 def get_layers_params(
     targets: Union[str, List[str]], module: Module
 ) -> Dict[str, ModelParameterizedLayer]:
-    params = get_params(targets, module)
-    layers = get_layers(targets, module)
-
+    # params are keyed by the name of the layer holding them, so the layers can be
+    # resolved directly rather than by matching targets against the module again
     parameterized_layers = {}
-    for name, param in params.items():
+    for name, param in get_params(targets, module).items():
         param_layer = ModelParameterizedLayer(
-            layer_name=name, layer=layers[name], param_name=name, param=param
+            name, get_layer_by_name(name, module), name, param
         )
         parameterized_layers[name] = param_layer
 
@@ -300,7 +626,7 @@ def get_layers_params(
 
 
 def get_matching_layer(
-    target: str, name_to_match: str, module: Module
+    target: str, name_to_match: str, module: Module, use_legacy: bool = False
 ) -> Optional[Tuple[str, Module]]:
     """
     Given a target regex, find the layer name in the module that most closely matches
@@ -308,27 +634,100 @@ def get_matching_layer(
     instance matching "re.*k_proj" to "model.decoder.layer.0.q_proj" to find the k_proj
     that exists in layer 0.
 
+    Candidates sharing the layer index of name_to_match (e.g. ".0.") are preferred,
+    remaining ties are broken by the length of the common prefix and suffix
+
     :param target: regex to search for
     :param name_to_match: full layer name to match to, should exist in module
     :param module: module to search for target in
+    :param use_legacy: if True, pick the candidate with the longest common substring
+        with name_to_match instead, which is considerably slower
     :return: Tuple containing the layer name and module that fits the target regex and
     best matches name_to_match, or None if no match can be found
     """
     potential_matches = get_layers(target, module)
-    largest_substring = 0
-    match = None
-    for name, module in potential_matches.items():
-        seq_matcher = difflib.SequenceMatcher(None, name, name_to_match)
-        _, _, match_length = seq_matcher.find_longest_match(
-            0, len(name), 0, len(name_to_match)
+    if use_legacy:
+        return _get_best_match(
+            list(potential_matches.items()), name_to_match, _longest_substring_length
         )
-        if match_length > largest_substring:
-            match = (name, module)
-            largest_substring = match_length
+
+    if name_to_match in potential_matches:
+        return name_to_match, potential_matches[name_to_match]
+
+    candidates = list(potential_matches.items())
+    layer_index = _LAYER_INDEX_PATTERN.search(name_to_match)
+    if layer_index is not None:
+        same_index = [item for item in candidates if layer_index.group(0) in item[0]]
+        if len(same_index) == 1:
+            return same_index[0]
+        if len(same_index) > 1:
+            candidates = same_index
+
+    match = _get_best_match(candidates, name_to_match, _common_affix_length)
+    if match is None:
+        # names share no prefix or suffix at all, compare by substrings instead
+        return _get_best_match(candidates, name_to_match, _longest_substring_length)
 
     return match
 
 
+def _get_best_match(
+    candidates: List[Tuple[str, Module]],
+    name_to_match: str,
+    score_fn: Callable[[str, str], int],
+) -> Optional[Tuple[str, Module]]:
+    """
+    :param score_fn: similarity of two names, which may not exceed the length of
+        the shorter name
+    :return: the first candidate with the highest nonzero score, or None
+    """
+    # candidates close in length to name_to_match are tried first, since they can
+    # score the highest and let the remaining candidates be skipped
+    order = sorted(
+        range(len(candidates)),
+        key=lambda index: abs(len(candidates[index][0]) - len(name_to_match)),
+    )
+
+    best_index = -1
+    best_score = 0
+    for index in order:
+        name = candidates[index][0]
+        max_score = min(len(name), len(name_to_match))
+        if max_score < best_score or (max_score == best_score and index > best_index):
+            continue  # cannot beat the current best match
+
+        score = score_fn(name, name_to_match)
+        if score > best_score or (score == best_score and index < best_index):
+            best_index = index
+            best_score = score
+
+    return candidates[best_index] if best_index >= 0 else None
+
+
+def _longest_substring_length(name: str, other: str) -> int:
+    seq_matcher = difflib.SequenceMatcher(None, name, other)
+    _, _, match_length = seq_matcher.find_longest_match(0, len(name), 0, len(other))
+
+    return match_length
+
+
+def _common_affix_length(name: str, other: str) -> int:
+    """
+    :return: length of the common prefix plus the length of the common suffix of
+        the remainder, which is never larger than the shorter of the two names
+    """
+    max_length = min(len(name), len(other))
+    prefix = 0
+    while prefix < max_length and name[prefix] == other[prefix]:
+        prefix += 1
+
+    suffix = 0
+    while suffix < max_length - prefix and name[-1 - suffix] == other[-1 - suffix]:
+        suffix += 1
+
+    return prefix + suffix
+
+
 def get_no_split_params(model: PreTrainedModel) -> Union[str, List[str]]:
     """
     Get list of module classes that shouldn't be split when sharding. For
@@ -355,7 +754,12 @@ def get_layer_by_name(layer_name: str, module: Module) -> Module:
     """
     if not layer_name:
         return module
-    return attrgetter(layer_name)(module)
+    return _attrgetter(layer_name)(module)
+
+
+@lru_cache(maxsize=4096)
+def _attrgetter(path: str) -> Callable[[object], object]:
+    return attrgetter(path)
 
 
 def get_module_to_name_dict(model: Module) -> dict[Module, str]:
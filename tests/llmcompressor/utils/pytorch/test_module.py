@@ -1,7 +1,21 @@
 import pytest
+import torch
 import torch.nn as nn
+from compressed_tensors import InternalModule
 
-from llmcompressor.utils.pytorch import get_layer_by_name
+from llmcompressor.utils.pytorch import (
+    cache_module_lookups,
+    clear_module_cache,
+    get_layer_by_name,
+    get_layers,
+    get_matching_layer,
+    get_params,
+    match_targets,
+    qat_active,
+    set_layer,
+    set_layers,
+)
+from llmcompressor.utils.pytorch.module import get_default_params, match_class
 
 
 @pytest.fixture
@@ -14,6 +28,22 @@ def example_nested_module() -> str:
     )
 
 
+@pytest.fixture
+def example_decoder_module() -> nn.Module:
+    decoder = nn.Module()
+    decoder.layers = nn.ModuleList(
+        nn.ModuleDict(
+            {
+                "q_proj": nn.Linear(10, 10),
+                "k_proj": nn.Linear(10, 10),
+                "mlp": nn.ModuleDict({"up_proj": nn.Linear(10, 20)}),
+            }
+        )
+        for _ in range(12)
+    )
+    return decoder
+
+
 @pytest.mark.unit
 def test_get_layer_by_name(example_nested_module):
     # Test getting the parent of a nested layer
@@ -36,3 +66,245 @@ def test_get_layer_by_name(example_nested_module):
     # Test getting the parent of a non-existent layer
     with pytest.raises(AttributeError):
         get_layer_by_name("non_existent_layer", example_nested_module)
+
+
+@pytest.mark.unit
+def test_match_targets():
+    assert match_targets("model.layers.0.q_proj", "model.layers.0.q_proj") == 0
+    assert match_targets("model.layers.0.q_proj", ["k_proj", "re:.*q_proj$"]) == 1
+    assert match_targets("model.layers.0.q_proj", ("re:.*k_proj$",)) == -1
+
+    # regexes are anchored at the start of the name, as with re.match
+    assert match_targets("model.layers.0.q_proj", "re:q_proj") == -1
+
+
+@pytest.mark.unit
+def test_match_class():
+    assert match_class(nn.Linear(1, 1), "Linear") == 0
+    assert match_class(nn.Linear(1, 1), ["re:Linear", "ReLU", "Linear"]) == 2
+    assert match_class(nn.ReLU(), ("Linear", "torch.nn.ReLU")) == -1
+
+
+@pytest.mark.unit
+def test_get_layers(example_nested_module):
+    layers = get_layers(["1.1", "re:2\\..*", "Softmax"], example_nested_module)
+    assert layers == {
+        "1.1": example_nested_module[1][1],
+        "2.0": example_nested_module[2][0],
+        "2.1": example_nested_module[2][1],
+        "3": example_nested_module[3],
+    }
+
+    # parameter names resolve to the layer which owns them
+    layers = get_layers("re:.*1\\.weight$", example_nested_module)
+    assert layers == {
+        "1.1": example_nested_module[1][1],
+        "2.1": example_nested_module[2][1],
+    }
+
+    # layers are returned in module order, regardless of the order of targets
+    layers = get_layers(["2.1", "1.1.weight", "0"], example_nested_module)
+    assert list(layers.keys()) == ["0", "1.1", "2.1"]
+
+    with pytest.raises(ValueError):
+        get_layers(["1.1", "non_existent_layer"], example_nested_module)
+
+
+@pytest.mark.unit
+def test_get_params(example_nested_module):
+    params = get_params("re:.*bias$", example_nested_module)
+    assert params == {
+        "0": example_nested_module[0].bias,
+        "1.1": example_nested_module[1][1].bias,
+        "2.1": example_nested_module[2][1].bias,
+    }
+
+    # layer names are not parameter names
+    with pytest.raises(ValueError):
+        get_params("1.1", example_nested_module)
+
+    # parameters registered as None are skipped
+    example_nested_module[1].register_parameter("scale", None)
+    with pytest.raises(ValueError):
+        get_params("re:.*scale$", example_nested_module)
+
+
+@pytest.mark.unit
+def test_get_layers_cache(example_nested_module):
+    # lookups are not cached outside of a cache_module_lookups context
+    layers = get_layers("re:1\\..*", example_nested_module)
+    assert get_layers("re:1\\..*", example_nested_module) is not layers
+    del example_nested_module[1][1]
+    assert "1.1" not in get_layers("re:1\\..*", example_nested_module)
+
+    with cache_module_lookups(example_nested_module):
+        layers = get_layers("re:1\\..*", example_nested_module)
+        assert get_layers("re:1\\..*", example_nested_module) is layers
+        with pytest.raises(TypeError):
+            layers["0"] = nn.Identity()
+
+        # layers replaced with set_layer are picked up
+        new_layer = nn.Linear(20, 10)
+        set_layer("1.0", new_layer, example_nested_module)
+        assert get_layers("1.0", example_nested_module)["1.0"] is new_layer
+
+        # including layers replaced through a submodule
+        assert "2.1" in get_layers("2.1", example_nested_module)
+        new_layer = nn.Linear(20, 10)
+        set_layer("1", new_layer, example_nested_module[2])
+        assert get_layers("2.1", example_nested_module)["2.1"] is new_layer
+
+        # other structural changes need to be cleared explicitly
+        with clear_module_cache(example_nested_module):
+            example_nested_module[1].append(nn.Linear(10, 10))
+        assert "1.1" in get_layers("re:1\\..*", example_nested_module)
+
+    assert get_layers("re:1\\..*", example_nested_module) is not layers
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("use_legacy", [False, True])
+@pytest.mark.parametrize(
+    "target,name_to_match,expected",
+    [
+        ("re:.*k_proj$", "layers.1.q_proj", "layers.1.k_proj"),
+        ("re:.*k_proj$", "layers.11.mlp.up_proj", "layers.11.k_proj"),
+        ("re:.*up_proj$", "layers.0.k_proj", "layers.0.mlp.up_proj"),
+        ("re:.*proj$", "layers.10.k_proj", "layers.10.k_proj"),
+    ],
+)
+def test_get_matching_layer(
+    example_decoder_module, target, name_to_match, expected, use_legacy
+):
+    name, layer = get_matching_layer(
+        target, name_to_match, example_decoder_module, use_legacy=use_legacy
+    )
+    assert name == expected
+    assert layer is example_decoder_module.get_submodule(expected)
+
+
+@pytest.mark.unit
+def test_qat_active(example_nested_module):
+    assert not qat_active(example_nested_module)
+
+    # shared submodules and cycles are only visited once
+    example_nested_module[2].append(example_nested_module[1])
+    example_nested_module[1].append(example_nested_module)
+    assert not qat_active(example_nested_module)
+
+    example_nested_module[1].append(torch.quantization.FakeQuantize())
+    assert qat_active(example_nested_module)
+
+
+@pytest.mark.unit
+def test_set_layer(example_nested_module):
+    old_layer = example_nested_module[2][1]
+    new_layer = nn.Linear(20, 10)
+    assert set_layer("2.1", new_layer, example_nested_module) is old_layer
+    assert example_nested_module[2][1] is new_layer
+
+    new_layer = nn.Identity()
+    set_layer("3", new_layer, example_nested_module)
+    assert example_nested_module[3] is new_layer
+
+    with pytest.raises(ValueError):
+        set_layer("4.0", nn.Identity(), example_nested_module)
+
+    # only registered submodules are followed
+    example_nested_module.__dict__["unregistered"] = nn.Sequential(nn.ReLU())
+    with pytest.raises(ValueError):
+        set_layer("unregistered.0", nn.Identity(), example_nested_module)
+
+
+@pytest.mark.unit
+def test_get_layers_exclude_internal_modules(example_nested_module):
+    example_nested_module[1].append(InternalModule())
+
+    assert "1.2" in get_layers("re:1\\..*", example_nested_module)
+    layers = get_layers(
+        "re:1\\..*", example_nested_module, exclude_internal_modules=True
+    )
+    assert list(layers.keys()) == ["1.0", "1.1"]
+
+    layers = get_layers(["1.1", "1.2"], example_nested_module)
+    assert list(layers.keys()) == ["1.1", "1.2"]
+    layers = get_layers(
+        ["1.1", "1.2"], example_nested_module, exclude_internal_modules=True
+    )
+    assert list(layers.keys()) == ["1.1"]
+
+    # targets matching only internal modules are found, but not returned
+    layers = get_layers(
+        "re:1\\.2$", example_nested_module, exclude_internal_modules=True
+    )
+    assert layers == {}
+
+
+@pytest.mark.unit
+def test_set_layers(example_nested_module):
+    old_layers = {"0": example_nested_module[0], "1.1": example_nested_module[1][1]}
+    new_layers = {"0": nn.Linear(10, 20), "1.1": nn.Linear(20, 10)}
+
+    assert set_layers(new_layers, example_nested_module) == old_layers
+    assert example_nested_module[0] is new_layers["0"]
+    assert example_nested_module[1][1] is new_layers["1.1"]
+    assert get_layers("1.1", example_nested_module)["1.1"] is new_layers["1.1"]
+
+
+@pytest.mark.unit
+def test_get_default_params():
+    class WeightForwardingWrapper(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.linear = nn.Linear(10, 10)
+
+        @property
+        def weight(self):
+            return self.linear.weight
+
+    wrapper = WeightForwardingWrapper()
+    params = get_default_params({"": wrapper, "linear": wrapper.linear})
+
+    # only weights registered on the layer itself are returned
+    assert params == {"linear": wrapper.linear.weight}
+
+
+@pytest.mark.unit
+def test_set_layers_invalid_target(example_nested_module):
+    old_layers = list(example_nested_module.modules())
+    new_layers = {"0": nn.Linear(10, 20), "4.0": nn.Identity()}
+
+    with pytest.raises(ValueError):
+        set_layers(new_layers, example_nested_module)
+    assert list(example_nested_module.modules()) == old_layers
+
+    # layers which cannot be assigned are rolled back as well
+    new_layers = {"0": nn.Linear(10, 20), "1.1": "not a module"}
+    with pytest.raises(TypeError):
+        set_layers(new_layers, example_nested_module)
+    assert list(example_nested_module.modules()) == old_layers
+
+
+@pytest.mark.unit
+def test_get_layers_shared_submodule(example_nested_module):
+    example_nested_module[1].tied = example_nested_module[0]
+
+    # exact paths resolve shared submodules under every name they are registered
+    # under, while scanning only visits them under their first name
+    layers = get_layers("1.tied", example_nested_module)
+    assert layers == {"1.tied": example_nested_module[0]}
+    params = get_params("1.tied.weight", example_nested_module)
+    assert params == {"1.tied": example_nested_module[0].weight}
+
+    with pytest.raises(ValueError):
+        get_layers("re:1\\.tied$", example_nested_module)
+
+
+@pytest.mark.unit
+def test_set_layers_nested_targets(example_nested_module):
+    old_layers = list(example_nested_module.modules())
+    new_layers = {"1": nn.Sequential(nn.ReLU()), "1.0": nn.Identity()}
+
+    with pytest.raises(ValueError):
+        set_layers(new_layers, example_nested_module)
+    assert list(example_nested_module.modules()) == old_layers